@@ -31,18 +31,39 @@ Example:
         >>> raspberrypinixie.led_set(led1=True, led3=True,
                                      led5=True, led6=True)
 
+RPi.GPIO is used to drive the pins by default. Any object providing the same
+interface (setmode, setup, output, cleanup and the LOW, HIGH, BOARD and OUT
+constants) can be installed instead, e.g. to record the emitted edges.
+
+Example:
+
+        >>> from raspberrypinixie_trace import TraceRecorder
+        >>> raspberrypinixie.set_backend(
+                TraceRecorder(raspberrypinixie.GPIO, "nixie.trace"))
+
 """
 from __future__ import (absolute_import, division, print_function,
                         unicode_literals)
 import time
 import itertools
 import logging
-from RPi import GPIO
+import gc
+import os
+import threading
+try:
+    from RPi import GPIO
+except ImportError:
+    # RPi.GPIO is only available on a Raspberry Pi. The library can still be
+    # imported elsewhere (e.g. to decode traces) but a backend must be
+    # installed with set_backend before calling setup.
+    GPIO = None
 
 __title__ = 'raspberrypinixie'
 __version__ = '1.0.0'
 __author__ = 'Sroaj Sosothikul'
-__all__ = ["setup", "cleanup", "led_set", "nixie_set"]
+__all__ = ["setup", "cleanup", "led_set", "nixie_set", "nixie_pack",
+           "nixie_set_packed", "set_backend", "realtime_enable",
+           "realtime_disable", "Reconciler"]
 
 PULSE_WIDTH_SEC = 1.0 / 10000.0
 
@@ -62,8 +83,41 @@ NIXIE_OUTPUT_PINS = [NIXIE_SER, NIXIE_nOE, NIXIE_RCLK, NIXIE_SRCLK]
 
 logger = logging.getLogger("raspberrypinixie")
 
+# Flags for mlockall on Linux.
+_MCL_CURRENT = 1
+_MCL_FUTURE = 2
+
+# When True, the garbage collector is disabled while shift registers are
+# loaded. Set by realtime_enable.
+_gc_guard = False
+
+# What realtime_enable changed and the values to restore on realtime_disable.
+_realtime_restore = {}  # type: Dict[str, Any]
+
+_monotonic = getattr(time, "monotonic", time.time)
+
+# Held while a shift register is being loaded.
+_shift_register_lock = threading.Lock()
+
+# The number of application updates waiting for or holding
+# _shift_register_lock. Guarded by _pending_lock.
+_pending_updates = 0
+_pending_lock = threading.Lock()
+
+# The last values latched into each shift register by the application, keyed
+# by SER pin, as (SRCLK pin, RCLK pin, values). Guarded by
+# _shift_register_lock.
+_latched_frames = {}  # type: Dict[int, Tuple[int, int, Tuple[bool, ...]]]
 
-def _pin_pulse(pin, initial_state=GPIO.LOW, pulse_width=PULSE_WIDTH_SEC):
+# When the application last loaded a shift register, from _monotonic.
+_last_update = 0.0
+
+# The shortest time a Reconciler waits before retrying when the display was
+# busy, so that a display updated continuously is not polled continuously.
+RECONCILE_MIN_RETRY_SEC = 0.1
+
+
+def _pin_pulse(pin, initial_state=False, pulse_width=PULSE_WIDTH_SEC):
     # type: (int, bool, Union[int, float]) -> None
     """Sends one pulse to the specified pin.
 
@@ -72,7 +126,7 @@ def _pin_pulse(pin, initial_state=GPIO.LOW, pulse_width=PULSE_WIDTH_SEC):
     Args:
         pin: The pin to pulse.
         initial_state: The negation of this will be used as the pulse.
-            Defaults to GPIO.LOW.
+            Defaults to low.
         pulse_width: how long, in seconds, to pulse the pin.
             Defaults to PULSE_WIDTH_SEC.
     """
@@ -83,6 +137,58 @@ def _pin_pulse(pin, initial_state=GPIO.LOW, pulse_width=PULSE_WIDTH_SEC):
         GPIO.output(pin, initial_state)
 
 
+def _shift_out(ser_pin, srclk_pin, rclk_pin, binary_inputs, abort=None):
+    # type: (int, int, int, Sequence[bool], Optional[Callable]) -> bool
+    """Clocks values into a shift register and latches them.
+
+    Args:
+        ser_pin: The pin to use for binary data output.
+        srclk_pin: The pin to use as clock for binary data.
+        rclk_pin: The pin to use to trigger the output of data.
+        binary_inputs: The values to load the shift register
+        abort: Called before each value is loaded. If it returns True, the
+            load is stopped before the data is latched. Defaults to None.
+
+    Returns:
+        True if the data was latched, False if it was aborted.
+    """
+    # A garbage collection pause in the middle of the load would stretch the
+    # clock pulses, so keep the collector off until the data is latched.
+    gc_paused = _gc_guard and gc.isenabled()
+    if gc_paused:
+        gc.disable()
+    try:
+        clock_high = False
+        try:
+            # Use each element in the list as binary data output
+            for output_bit in binary_inputs:
+                if abort is not None and abort():
+                    return False
+                if clock_high:
+                    # The shift register samples SER on the rising edge of
+                    # SRCLK, so the next value can be output together with
+                    # the end of the previous clock pulse. Backends which
+                    # support bulk writes do this in a single call.
+                    GPIO.output([srclk_pin, ser_pin], [GPIO.LOW, output_bit])
+                else:
+                    GPIO.output(ser_pin, output_bit)
+                GPIO.output(srclk_pin, GPIO.HIGH)
+                clock_high = True
+                time.sleep(PULSE_WIDTH_SEC)
+        finally:
+            if clock_high:
+                GPIO.output(srclk_pin, GPIO.LOW)
+
+        # Data has been loaded, trigger the output of data
+        _pin_pulse(rclk_pin)
+        # This is not in a try finally so that partially loaded data is never
+        # displayed
+        return True
+    finally:
+        if gc_paused:
+            gc.enable()
+
+
 def _load_shift_register(ser_pin, srclk_pin, rclk_pin, binary_inputs):
     # type: (int, int, int, Iterable[bool]) -> None
     """Loads a shift register from a binary list.
@@ -93,29 +199,39 @@ def _load_shift_register(ser_pin, srclk_pin, rclk_pin, binary_inputs):
     Remember that the first value loaded into a shift register is shifted to
     become the last value in the register.
 
+    The values are remembered so that a Reconciler can send them again. A
+    reconciliation in progress gives way to this load.
+
     Args:
         ser_pin: The pin to use for binary data output.
         srclk_pin: The pin to use as clock for binary data.
         rclk_pin: The pin to use to trigger the output of data.
         binary_inputs: The values to load the shift register
     """
-    if logger.isEnabledFor(logging.DEBUG):
-        # The binary_inputs may be a generator, so save all the binary_inputs
-        # into a list so they can be iterated over more than once.
-        binary_inputs = list(binary_inputs)
-        logger.debug("Loading shift register using pins (SER: %s, SRCLK: %s, "
-                     "RCLK: %s) with the following values: %s",
-                     ser_pin, srclk_pin, rclk_pin, binary_inputs)
+    global _pending_updates, _last_update
+    # The binary_inputs may be a generator, so save all the binary_inputs
+    # into a tuple so they can be iterated over more than once.
+    binary_inputs = tuple(binary_inputs)
+    logger.debug("Loading shift register using pins (SER: %s, SRCLK: %s, "
+                 "RCLK: %s) with the following values: %s",
+                 ser_pin, srclk_pin, rclk_pin, binary_inputs)
+
+    with _pending_lock:
+        _pending_updates += 1
+    try:
+        with _shift_register_lock:
+            _shift_out(ser_pin, srclk_pin, rclk_pin, binary_inputs)
+            _latched_frames[ser_pin] = (srclk_pin, rclk_pin, binary_inputs)
+            _last_update = _monotonic()
+    finally:
+        with _pending_lock:
+            _pending_updates -= 1
 
-    # Use each element in the list as binary data output
-    for output_bit in binary_inputs:
-        GPIO.output(ser_pin, output_bit)
-        _pin_pulse(srclk_pin)
 
-    # Data has been loaded, trigger the output of data
-    _pin_pulse(rclk_pin)
-    # This is not in a try finally so that partially loaded data is never
-    # displayed
+def _update_pending():
+    # type: () -> bool
+    """Returns True if an application update is waiting to load."""
+    return _pending_updates > 0
 
 
 def _int_to_bcd(value):
@@ -259,6 +375,370 @@ def nixie_set(nixie1=None,  # type: Optional[int]
                          shift_register_inputs)
 
 
+def nixie_pack(nixie1=None,  # type: Optional[int]
+               nixie2=None,  # type: Optional[int]
+               nixie3=None,  # type: Optional[int]
+               nixie4=None,  # type: Optional[int]
+               nixie5=None,  # type: Optional[int]
+               nixie6=None,  # type: Optional[int]
+               ):
+    # type: (...) -> int
+    """Packs Nixie tube values into a single word for nixie_set_packed.
+
+    Each Nixie tube uses 4 bits holding its BCD value, starting with Nixie
+    tube 1 in the least significant bits. A value of None is packed as all
+    high which turns that Nixie tube off, as in nixie_set.
+
+    Packing values ahead of time, e.g. into a table, avoids converting them
+    every time they are displayed.
+
+    Args:
+        nixie1: Value of Nixie tube 1. Defaults to None.
+        nixie2: Value of Nixie tube 2. Defaults to None.
+        nixie3: Value of Nixie tube 3. Defaults to None.
+        nixie4: Value of Nixie tube 4. Defaults to None.
+        nixie5: Value of Nixie tube 5. Defaults to None.
+        nixie6: Value of Nixie tube 6. Defaults to None.
+
+    Returns:
+        The packed Nixie tube values.
+    """
+    nixie_digits = (nixie1, nixie2, nixie3, nixie4, nixie5, nixie6)
+    packed = 0
+    for index, value in enumerate(nixie_digits):
+        if value is None:
+            value = 0xF
+        elif not 0 <= value <= 9:
+            raise ValueError("Specified input must be either None or between "
+                             "0 and 9. Input was: {!r}.".format(value))
+        packed |= value << (index * 4)
+    return packed
+
+
+# The bit of a packed word to load for each clock of the Nixie shift
+# registers: 6 Nixie tubes of 4 bits each. The most significant bit is loaded
+# first so that it is shifted to become the last value in the register, just
+# like nixie_set.
+_NIXIE_PACKED_SHIFT_ORDER = tuple(range(6 * 4 - 1, -1, -1))
+
+
+def nixie_set_packed(packed):
+    # type: (int) -> None
+    """Sets the Nixie tubes to values packed by nixie_pack.
+
+    Args:
+        packed: The packed Nixie tube values.
+    """
+    logger.info("Setting packed Nixie values: %06x", packed)
+    _load_shift_register(NIXIE_SER, NIXIE_SRCLK, NIXIE_RCLK,
+                         [(packed >> bit) & 1
+                          for bit in _NIXIE_PACKED_SHIFT_ORDER])
+
+
+def _as_list(channels):
+    # type: (Union[int, Iterable[int]]) -> List[int]
+    """Normalizes a channel or list of channels, as accepted by RPi.GPIO."""
+    if isinstance(channels, (list, tuple)):
+        return list(channels)
+    return [channels]
+
+
+def _pair_outputs(channels, values):
+    # type: (Union[int, List[int]], Any) -> Iterable[Tuple[int, bool]]
+    """Pairs channels with values following the RPi.GPIO output semantics.
+
+    A single value is applied to every channel, otherwise each channel gets
+    the value at the same position.
+    """
+    channels = _as_list(channels)
+    if isinstance(values, (list, tuple)):
+        if len(values) != len(channels):
+            raise ValueError("Number of values ({}) does not match the number "
+                             "of channels ({}).".format(len(values),
+                                                        len(channels)))
+        return zip(channels, values)
+    return zip(channels, itertools.repeat(values))
+
+
+def set_backend(backend):
+    # type: (Any) -> None
+    """Sets the object used to drive the GPIO pins.
+
+    The backend must provide the subset of the RPi.GPIO module interface used
+    by this library: setmode, setup, output, cleanup and the LOW, HIGH, BOARD
+    and OUT constants. This should be called before setup.
+
+    Args:
+        backend: The GPIO backend to use for all subsequent operations.
+    """
+    global GPIO
+    logger.info("Using GPIO backend: %r", backend)
+    GPIO = backend
+
+
+def _libc_call(name, *args):
+    # type: (str, *int) -> None
+    """Calls a C library function, raising OSError if it fails."""
+    import ctypes
+    import ctypes.util
+    libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+    if getattr(libc, name)(*args) != 0:
+        errno = ctypes.get_errno()
+        raise OSError(errno, os.strerror(errno))
+
+
+def realtime_enable(priority=50,  # type: Optional[int]
+                    cpus=None,  # type: Optional[Iterable[int]]
+                    lock_memory=True,  # type: bool
+                    gc_guard=True,  # type: bool
+                    ):
+    # type: (...) -> Dict[str, bool]
+    """Applies a real-time profile to the thread that drives the GPIO pins.
+
+    This reduces latch jitter caused by the process being preempted or paused
+    by the garbage collector while a shift register is being loaded. It acts
+    on the calling thread, so it must be called from the thread that calls
+    led_set and nixie_set.
+
+    Each part of the profile is applied independently. Parts which are not
+    permitted (e.g. not running as root) or not supported by the platform
+    are logged and skipped.
+
+    Args:
+        priority: The SCHED_FIFO priority, from 1 to 99. Defaults to 50.
+            None leaves the scheduler policy unchanged.
+        cpus: The CPUs to pin the thread to. Defaults to None which leaves
+            the CPU affinity unchanged.
+        lock_memory: Lock all current and future memory of the process to
+            avoid page faults. Defaults to True.
+        gc_guard: Freeze the objects allocated so far out of the garbage
+            collector and disable it while shift registers are loaded.
+            Defaults to True.
+
+    Returns:
+        dict of which parts of the profile were applied, keyed by
+        "scheduler", "affinity", "lock_memory" and "gc_guard".
+    """
+    global _gc_guard
+    applied = dict.fromkeys(("scheduler", "affinity", "lock_memory",
+                             "gc_guard"), False)
+
+    if priority is not None:
+        try:
+            previous = (os.sched_getscheduler(0), os.sched_getparam(0))
+            os.sched_setscheduler(0, os.SCHED_FIFO,
+                                  os.sched_param(priority))
+        except (AttributeError, OSError) as e:
+            logger.warning("Unable to set SCHED_FIFO priority %s: %s",
+                           priority, e)
+        else:
+            _realtime_restore.setdefault("scheduler", previous)
+            applied["scheduler"] = True
+
+    if cpus is not None:
+        try:
+            previous = os.sched_getaffinity(0)
+            os.sched_setaffinity(0, cpus)
+        except (AttributeError, OSError) as e:
+            logger.warning("Unable to set CPU affinity to %s: %s", cpus, e)
+        else:
+            _realtime_restore.setdefault("affinity", previous)
+            applied["affinity"] = True
+
+    if lock_memory:
+        try:
+            _libc_call("mlockall", _MCL_CURRENT | _MCL_FUTURE)
+        except (AttributeError, OSError) as e:
+            logger.warning("Unable to lock memory: %s", e)
+        else:
+            _realtime_restore["lock_memory"] = True
+            applied["lock_memory"] = True
+
+    if gc_guard:
+        # Objects which survived until now, e.g. imported modules, do not
+        # need to be scanned again on every collection.
+        freeze = getattr(gc, "freeze", None)
+        if freeze is not None:
+            gc.collect()
+            freeze()
+        _gc_guard = True
+        applied["gc_guard"] = True
+
+    logger.info("Real-time profile applied: %s", applied)
+    return applied
+
+
+def realtime_disable():
+    # type: () -> None
+    """Reverts the parts of the profile applied by realtime_enable.
+
+    Like realtime_enable, this acts on the calling thread, so it must be
+    called from the thread which called realtime_enable. Parts which fail to
+    revert are logged and skipped.
+    """
+    global _gc_guard
+    try:
+        if "scheduler" in _realtime_restore:
+            policy, param = _realtime_restore.pop("scheduler")
+            try:
+                os.sched_setscheduler(0, policy, param)
+            except OSError as e:
+                logger.warning("Unable to restore the scheduler policy: %s",
+                               e)
+        if "affinity" in _realtime_restore:
+            try:
+                os.sched_setaffinity(0, _realtime_restore.pop("affinity"))
+            except OSError as e:
+                logger.warning("Unable to restore the CPU affinity: %s", e)
+        if _realtime_restore.pop("lock_memory", False):
+            try:
+                _libc_call("munlockall")
+            except (AttributeError, OSError) as e:
+                logger.warning("Unable to unlock memory: %s", e)
+    finally:
+        if _gc_guard:
+            _gc_guard = False
+            if hasattr(gc, "unfreeze"):
+                gc.unfreeze()
+    logger.info("Real-time profile reverted")
+
+
+class Reconciler(object):
+    """Periodically sends the last LED and Nixie frames again.
+
+    There is no way to read back the shift registers, so a register which
+    latched noise would keep displaying it until the next update. The
+    reconciler fixes this by loading the last frames set by the application
+    again, in a background thread.
+
+    Reconciliation only happens once no update was made for idle seconds. An
+    update made during a reconciliation stops it before anything is latched,
+    so the update waits for at most one clock pulse.
+
+    Example:
+        >>> reconciler = raspberrypinixie.Reconciler(interval=30)
+        >>> reconciler.start()
+        >>> # Your code here
+        >>> reconciler.stop()
+        >>> raspberrypinixie.cleanup()
+
+    Args:
+        interval: Seconds between reconciliations. Defaults to 10.
+        idle: Seconds without updates before reconciling. Defaults to 0.5.
+        budget: The largest fraction of time to spend reconciling, including
+            checking whether the display is idle. The wait between attempts
+            is extended as needed to stay within it. Defaults to 0.01.
+
+    Raises:
+        ValueError: If interval or idle is not positive, or budget is not
+            greater than 0 and at most 1.
+
+    Attributes:
+        runs: The number of reconciliations which latched every frame.
+        aborted: The number of reconciliations stopped by an update.
+        deferred: The number of reconciliations postponed as the display was
+            not idle or had no frames.
+        gpio_seconds: The total time spent driving the GPIO pins.
+    """
+
+    def __init__(self, interval=10.0, idle=0.5, budget=0.01):
+        # type: (float, float, float) -> None
+        if interval <= 0:
+            raise ValueError("interval must be greater than 0. Input was: "
+                             "{!r}.".format(interval))
+        if idle <= 0:
+            raise ValueError("idle must be greater than 0. Input was: "
+                             "{!r}.".format(idle))
+        if not 0 < budget <= 1:
+            raise ValueError("budget must be greater than 0 and at most 1. "
+                             "Input was: {!r}.".format(budget))
+        self.interval = interval
+        self.idle = idle
+        self.budget = budget
+        self.runs = 0
+        self.aborted = 0
+        self.deferred = 0
+        self.gpio_seconds = 0.0
+        self._stop = threading.Event()
+        self._thread = None  # type: Optional[threading.Thread]
+
+    @property
+    def stats(self):
+        # type: () -> Dict[str, Union[int, float]]
+        """The counters of this reconciler as a dict."""
+        return {"runs": self.runs, "aborted": self.aborted,
+                "deferred": self.deferred, "gpio_seconds": self.gpio_seconds}
+
+    def reconcile(self):
+        # type: () -> bool
+        """Sends the last frames once, if the display is idle.
+
+        Returns:
+            True if every frame was latched.
+        """
+        if (_monotonic() - _last_update < self.idle or
+                not _shift_register_lock.acquire(False)):
+            self.deferred += 1
+            return False
+        start = _monotonic()
+        try:
+            if not _latched_frames:
+                self.deferred += 1
+                return False
+            for ser_pin, frame in list(_latched_frames.items()):
+                srclk_pin, rclk_pin, binary_inputs = frame
+                if not _shift_out(ser_pin, srclk_pin, rclk_pin,
+                                  binary_inputs, abort=_update_pending):
+                    logger.debug("Reconciliation gave way to an update")
+                    self.aborted += 1
+                    return False
+        finally:
+            _shift_register_lock.release()
+            self.gpio_seconds += _monotonic() - start
+        logger.debug("Reconciled %s shift registers", len(_latched_frames))
+        self.runs += 1
+        return True
+
+    def _run(self):
+        # type: () -> None
+        """Reconciles until stopped."""
+        delay = self.interval
+        while not self._stop.wait(delay):
+            start = _monotonic()
+            reconciled = self.reconcile()
+            spent = _monotonic() - start
+            if reconciled:
+                delay = self.interval
+            else:
+                # Retry once the display could be idle again, but not more
+                # often than RECONCILE_MIN_RETRY_SEC.
+                delay = max(RECONCILE_MIN_RETRY_SEC,
+                            self.idle - (_monotonic() - _last_update))
+            # Never spend more than the budget on reconciling.
+            delay = max(delay, spent / self.budget - spent)
+
+    def start(self):
+        # type: () -> None
+        """Starts reconciling in a background thread."""
+        if self._thread is not None:
+            raise RuntimeError("Reconciler is already started.")
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run,
+                                        name="raspberrypinixie-reconciler")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        # type: () -> None
+        """Stops the background thread and waits for it to exit."""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        logger.info("Reconciler stopped: %s", self.stats)
+
+
 def setup(clear_led=True, clear_nixie=True):
     # type: (bool, bool) -> None
     """Setup the Raspberry Pi GPIO channels and clear Nixie tubes or LEDs.
@@ -270,7 +750,14 @@ def setup(clear_led=True, clear_nixie=True):
     Args:
         clear_led: Clear the LEDs. Defaults to True.
         clear_nixie: Clear the Nixie tubes. Defaults to True.
+
+    Raises:
+        RuntimeError: If RPi.GPIO is not available and no backend was set.
     """
+    if GPIO is None:
+        raise RuntimeError("RPi.GPIO is not available. Install it or set "
+                           "another backend with set_backend.")
+
     # Setup GPIO outputs.
     GPIO.setmode(GPIO.BOARD)
     GPIO.setup(LED_OUTPUTS_PINS + NIXIE_OUTPUT_PINS, GPIO.OUT,
@@ -315,8 +802,11 @@ def cleanup(clear_led=True, clear_nixie=True):
             nixie_set()
 
     finally:
-        # Cleanup the GPIO pins that were initialized in setup.
-        GPIO.cleanup(LED_OUTPUTS_PINS + NIXIE_OUTPUT_PINS)
+        with _shift_register_lock:
+            # Nothing is left to reconcile once the pins are released.
+            _latched_frames.clear()
+            # Cleanup the GPIO pins that were initialized in setup.
+            GPIO.cleanup(LED_OUTPUTS_PINS + NIXIE_OUTPUT_PINS)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""
+Precomputed clock frames for the raspberrypinixie library.
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+Every HHMMSS frame of the day is packed once at startup into a table indexed
+by the seconds since midnight, so each tick of a clock is a table lookup and
+a shift register load instead of formatting and converting the time.
+
+Example:
+        >>> import raspberrypinixie
+        >>> from raspberrypinixie_clock import ClockEngine
+        >>> clock = ClockEngine()
+        >>> raspberrypinixie.setup()
+        >>> clock.tick()
+
+Dates are displayed as YYMMDD with ClockEngine(date=True). Pass a tzinfo to
+display the time of a timezone other than the local one of the system.
+
+Running this module measures the startup cost and memory of the tables
+against the time saved on each tick.
+"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+from array import array
+import datetime as _dt
+import logging
+import time
+import raspberrypinixie
+
+__all__ = ["ClockEngine", "build_time_table", "build_date_table"]
+
+# How many days of date frames to build at a time.
+DATE_TABLE_DAYS = 366
+
+# A packed frame needs 24 bits. Use the smallest array type which fits it.
+_TABLE_TYPECODE = str("I") if array(str("I")).itemsize >= 4 else str("L")
+
+logger = logging.getLogger("raspberrypinixie")
+
+
+def _pack_two_digits(value, nixie_index):
+    # type: (int, int) -> int
+    """Packs a two digit value into a pair of Nixie tubes.
+
+    Args:
+        value: The value to pack, from 0 to 99.
+        nixie_index: The zero based index of the Nixie tube for the tens
+            digit. The ones digit uses the next Nixie tube.
+
+    Returns:
+        The packed value with all other Nixie tubes packed as 0 so that pairs
+        can be combined with a bitwise or.
+    """
+    return ((value // 10) | (value % 10) << 4) << (nixie_index * 4)
+
+
+def build_time_table():
+    # type: () -> array
+    """Builds the packed HHMMSS frames of a day.
+
+    Returns:
+        array of the packed frames indexed by the seconds since midnight.
+    """
+    hours = [_pack_two_digits(hour, 0) for hour in range(24)]
+    minutes = [_pack_two_digits(minute, 2) for minute in range(60)]
+    seconds = [_pack_two_digits(second, 4) for second in range(60)]
+    return array(_TABLE_TYPECODE, [hour | minute | second
+                                   for hour in hours
+                                   for minute in minutes
+                                   for second in seconds])
+
+
+def build_date_table(start, days=DATE_TABLE_DAYS):
+    # type: (_dt.date, int) -> array
+    """Builds the packed YYMMDD frames of consecutive days.
+
+    Args:
+        start: The date of the first frame.
+        days: The number of frames to build. Defaults to DATE_TABLE_DAYS.
+
+    Returns:
+        array of the packed frames indexed by the days since start.
+    """
+    table = array(_TABLE_TYPECODE)
+    for offset in range(days):
+        day = start + _dt.timedelta(days=offset)
+        table.append(_pack_two_digits(day.year % 100, 0) |
+                     _pack_two_digits(day.month, 2) |
+                     _pack_two_digits(day.day, 4))
+    return table
+
+
+class ClockEngine(object):
+    """Displays the current time or date on the Nixie tubes from a table.
+
+    The table for the selected mode is built when the engine is created.
+    Date tables cover DATE_TABLE_DAYS days from the current date and are
+    rebuilt when the date leaves that range.
+
+    Args:
+        tz: The timezone to display, as a tzinfo. Defaults to None which
+            uses the local time of the system.
+        date: Display the date as YYMMDD instead of the time as HHMMSS.
+            Defaults to False.
+        offset: Added to the current time before it is displayed. Defaults
+            to no offset.
+    """
+
+    def __init__(self, tz=None, date=False, offset=_dt.timedelta(0)):
+        # type: (Optional[_dt.tzinfo], bool, _dt.timedelta) -> None
+        self.tz = tz
+        self.date = date
+        self.offset = offset
+        self._date_start = None  # type: Optional[_dt.date]
+        self._date_table = array(_TABLE_TYPECODE)
+        self._time_table = array(_TABLE_TYPECODE)
+        start = time.time()
+        if date:
+            self._build_date_table(self.now().date())
+            table = self._date_table
+        else:
+            self._time_table = build_time_table()
+            table = self._time_table
+        logger.info("Built table of %s frames in %.3f seconds", len(table),
+                    time.time() - start)
+
+    def _build_date_table(self, start):
+        # type: (_dt.date) -> None
+        """Builds the date table starting from a date."""
+        self._date_start = start
+        self._date_table = build_date_table(start)
+
+    @property
+    def table_bytes(self):
+        # type: () -> int
+        """The memory used by the frame tables, in bytes."""
+        return sum(len(table) * table.itemsize
+                   for table in (self._time_table, self._date_table))
+
+    def now(self):
+        # type: () -> _dt.datetime
+        """Returns the time to display."""
+        return _dt.datetime.now(self.tz) + self.offset
+
+    def frame(self, now=None):
+        # type: (Optional[_dt.datetime]) -> int
+        """Returns the packed frame for a time.
+
+        Args:
+            now: The time to get the frame for. Defaults to the current time.
+
+        Returns:
+            The frame packed as by raspberrypinixie.nixie_pack.
+        """
+        if now is None:
+            now = self.now()
+        if self.date:
+            today = now.date()
+            if not 0 <= (today - self._date_start).days < \
+                    len(self._date_table):
+                self._build_date_table(today)
+            return self._date_table[(today - self._date_start).days]
+        return self._time_table[now.hour * 3600 + now.minute * 60 +
+                                now.second]
+
+    def tick(self, now=None):
+        # type: (Optional[_dt.datetime]) -> int
+        """Displays the frame for a time on the Nixie tubes.
+
+        Args:
+            now: The time to display. Defaults to the current time.
+
+        Returns:
+            The packed frame that was displayed.
+        """
+        packed = self.frame(now)
+        raspberrypinixie.nixie_set_packed(packed)
+        return packed
+
+
+if __name__ == "__main__":
+    import argparse
+    import itertools
+    import timeit
+    parser = argparse.ArgumentParser(
+        description="Measures the startup cost and memory of the clock "
+        "tables against the time saved on each tick. No GPIO is used.")
+    parser.add_argument("--ticks", type=int, default=100000,
+                        help="How many ticks to time each method over.")
+    args = parser.parse_args()
+
+    def format_tick():
+        # type: () -> List[int]
+        """The per tick work of formatting and converting the time."""
+        time_str = (_dt.datetime.now() +
+                    _dt.timedelta(hours=0)).strftime("%H%M%S")
+        return list(itertools.chain.from_iterable(
+            raspberrypinixie._int_to_bcd(int(i)) for i in time_str))
+
+    def table_tick():
+        # type: () -> List[int]
+        """The per tick work of looking up the time in the table."""
+        packed = clock.frame()
+        return [(packed >> bit) & 1
+                for bit in raspberrypinixie._NIXIE_PACKED_SHIFT_ORDER]
+
+    build_seconds = min(timeit.repeat(build_time_table, number=1, repeat=5))
+    clock = ClockEngine()
+    format_seconds = timeit.timeit(format_tick, number=args.ticks) / args.ticks
+    table_seconds = timeit.timeit(table_tick, number=args.ticks) / args.ticks
+
+    print("Time table build:      {:10.3f} ms".format(build_seconds * 1e3))
+    print("Time table memory:     {:10.1f} KiB".format(
+        clock.table_bytes / 1024))
+    print("Format per tick:       {:10.3f} us".format(format_seconds * 1e6))
+    print("Table lookup per tick: {:10.3f} us".format(table_seconds * 1e6))
+    saved = format_seconds - table_seconds
+    if saved > 0:
+        print("Table build pays for itself after {:.0f} ticks".format(
+            build_seconds / saved))
@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+"""
+Linux GPIO character device backend for the raspberrypinixie library.
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+Drives the pins through the GPIO character device (the interface used by
+libgpiod) instead of RPi.GPIO, which is deprecated on newer kernels. All the
+pins set up together are requested from the kernel at once, so any number of
+them can be written with a single ioctl. The library uses this to output the
+next SER value together with the end of each SRCLK pulse.
+
+Example:
+        >>> import raspberrypinixie
+        >>> from raspberrypinixie_gpiod import GpiodGPIO
+        >>> raspberrypinixie.set_backend(GpiodGPIO())
+        >>> raspberrypinixie.setup()
+
+Raspberry Pi 5 running kernels older than 6.6.45 expose the header pins on
+/dev/gpiochip4 instead of /dev/gpiochip0:
+
+        >>> raspberrypinixie.set_backend(GpiodGPIO("/dev/gpiochip4"))
+
+Only the ioctls of the version 2 uAPI are used, so the backend can be tested
+with the kernel's gpio-sim module or by passing a mocked ioctl function.
+"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+import fcntl
+import logging
+import os
+import struct
+import raspberrypinixie
+
+__all__ = ["GpiodGPIO", "BOARD_TO_BCM"]
+
+# BOARD pin number of the 40 pin header to the BCM GPIO number, which is the
+# line offset on the GPIO chip of the header.
+BOARD_TO_BCM = {
+    3: 2, 5: 3, 7: 4, 8: 14, 10: 15, 11: 17, 12: 18, 13: 27, 15: 22, 16: 23,
+    18: 24, 19: 10, 21: 9, 22: 25, 23: 11, 24: 8, 26: 7, 27: 0, 28: 1, 29: 5,
+    31: 6, 32: 12, 33: 13, 35: 19, 36: 16, 37: 26, 38: 20, 40: 21,
+}
+
+# From linux/gpio.h.
+GPIO_V2_LINES_MAX = 64
+GPIO_V2_LINE_NUM_ATTRS_MAX = 10
+GPIO_V2_LINE_FLAG_INPUT = 1 << 2
+GPIO_V2_LINE_FLAG_OUTPUT = 1 << 3
+GPIO_V2_LINE_ATTR_ID_OUTPUT_VALUES = 2
+
+# struct gpio_v2_line_config: flags, num_attrs, padding and attrs, each attr
+# being an id, padding, value and mask.
+_LINE_CONFIG = struct.Struct(str(
+    "<QI20x" + "IIQQ" * GPIO_V2_LINE_NUM_ATTRS_MAX))
+# struct gpio_v2_line_request: offsets, consumer, config, num_lines,
+# event_buffer_size, padding and the fd of the requested lines.
+_LINE_REQUEST = struct.Struct(str(
+    "<{}I32s{}sII20xi".format(GPIO_V2_LINES_MAX, _LINE_CONFIG.size)))
+# struct gpio_v2_line_values: bits and mask.
+_LINE_VALUES = struct.Struct(str("<QQ"))
+
+
+def _iowr(number, size):
+    # type: (int, int) -> int
+    """Returns the request code of a read/write GPIO ioctl."""
+    return (3 << 30) | (size << 16) | (0xB4 << 8) | number
+
+
+GPIO_V2_GET_LINE_IOCTL = _iowr(0x07, _LINE_REQUEST.size)
+GPIO_V2_LINE_SET_CONFIG_IOCTL = _iowr(0x0D, _LINE_CONFIG.size)
+GPIO_V2_LINE_SET_VALUES_IOCTL = _iowr(0x0F, _LINE_VALUES.size)
+
+logger = logging.getLogger("raspberrypinixie")
+
+
+def _pack_config(flags, values=0, mask=0):
+    # type: (int, int, int) -> bytes
+    """Packs a line config, with output values if a mask is specified."""
+    attrs = [0] * (4 * GPIO_V2_LINE_NUM_ATTRS_MAX)
+    num_attrs = 0
+    if mask:
+        attrs[0:4] = [GPIO_V2_LINE_ATTR_ID_OUTPUT_VALUES, 0, values, mask]
+        num_attrs = 1
+    return _LINE_CONFIG.pack(flags, num_attrs, *attrs)
+
+
+class GpiodGPIO(object):
+    """A GPIO backend using the Linux GPIO character device.
+
+    Args:
+        chip: Path of the GPIO chip with the header pins. Defaults to
+            /dev/gpiochip0.
+        consumer: The name shown as the user of the requested lines.
+            Defaults to "raspberrypinixie".
+        ioctl: The function used to perform ioctls, with the signature of
+            fcntl.ioctl. Defaults to fcntl.ioctl.
+    """
+    LOW = 0
+    HIGH = 1
+    BOARD = 10
+    BCM = 11
+    OUT = 0
+
+    def __init__(self, chip="/dev/gpiochip0", consumer="raspberrypinixie",
+                 ioctl=fcntl.ioctl):
+        # type: (str, str, Callable) -> None
+        self.chip = chip
+        self.consumer = consumer
+        self._ioctl = ioctl
+        self._mode = None  # type: Optional[int]
+        # The fd of each line request, by channel, with the bit of the
+        # channel within that request.
+        self._lines = {}  # type: Dict[int, Tuple[int, int]]
+
+    def __repr__(self):
+        # type: () -> str
+        return "{}({!r})".format(type(self).__name__, self.chip)
+
+    def setmode(self, mode):
+        # type: (int) -> None
+        if mode not in (self.BOARD, self.BCM):
+            raise ValueError("Mode must be BOARD or BCM. Input was: "
+                             "{!r}.".format(mode))
+        self._mode = mode
+
+    def _offset(self, channel):
+        # type: (int) -> int
+        """Converts a channel to its line offset on the chip."""
+        if self._mode is None:
+            raise RuntimeError("Call setmode before setting up channels.")
+        if self._mode == self.BCM:
+            return channel
+        try:
+            return BOARD_TO_BCM[channel]
+        except KeyError:
+            raise ValueError("BOARD pin {!r} is not a GPIO.".format(channel))
+
+    def setup(self, channels, direction, initial=LOW):
+        # type: (Union[int, List[int]], int, int) -> None
+        """Requests the channels from the kernel as outputs.
+
+        All the channels are requested together so that they can be written
+        with a single ioctl.
+        """
+        channels = raspberrypinixie._as_list(channels)
+        if direction != self.OUT:
+            raise ValueError("Only outputs are supported.")
+        if not 0 < len(channels) <= GPIO_V2_LINES_MAX:
+            raise ValueError("Between 1 and {} channels can be set up at "
+                             "once.".format(GPIO_V2_LINES_MAX))
+        in_use = set(channels) & set(self._lines)
+        if in_use:
+            raise RuntimeError("Channels already set up: {}".format(
+                sorted(in_use)))
+
+        offsets = [self._offset(channel) for channel in channels]
+        mask = (1 << len(channels)) - 1
+        request = bytearray(_LINE_REQUEST.pack(
+            *(offsets + [0] * (GPIO_V2_LINES_MAX - len(offsets)) +
+              [self.consumer.encode("ascii"),
+               _pack_config(GPIO_V2_LINE_FLAG_OUTPUT,
+                            mask if initial else 0, mask),
+               len(channels), 0, 0])))
+
+        chip_fd = os.open(self.chip, os.O_RDWR | getattr(os, "O_CLOEXEC", 0))
+        try:
+            self._ioctl(chip_fd, GPIO_V2_GET_LINE_IOCTL, request)
+        finally:
+            os.close(chip_fd)
+        line_fd = _LINE_REQUEST.unpack(bytes(request))[-1]
+        logger.debug("Requested lines %s of %s as fd %s", offsets, self.chip,
+                     line_fd)
+
+        for bit, channel in enumerate(channels):
+            self._lines[channel] = (line_fd, 1 << bit)
+
+    def output(self, channels, values):
+        # type: (Union[int, List[int]], Any) -> None
+        """Sets the channels, with one ioctl per request they belong to."""
+        writes = {}  # type: Dict[int, List[int]]
+        for channel, value in raspberrypinixie._pair_outputs(channels,
+                                                             values):
+            try:
+                line_fd, bit = self._lines[channel]
+            except KeyError:
+                raise RuntimeError("Channel {!r} is not set up as an "
+                                   "output.".format(channel))
+            write = writes.setdefault(line_fd, [0, 0])
+            if value:
+                write[0] |= bit
+            write[1] |= bit
+
+        for line_fd, (bits, mask) in writes.items():
+            # A buffer per call, as several threads may output at once.
+            self._ioctl(line_fd, GPIO_V2_LINE_SET_VALUES_IOCTL,
+                        bytearray(_LINE_VALUES.pack(bits, mask)))
+
+    def cleanup(self, channels=None):
+        # type: (Optional[Union[int, List[int]]]) -> None
+        """Sets the requests with any of the channels to input and releases
+        them, like RPi.GPIO does.
+        """
+        if channels is None:
+            channels = list(self._lines)
+        line_fds = set(self._lines[channel][0]
+                       for channel in raspberrypinixie._as_list(channels)
+                       if channel in self._lines)
+        for line_fd in line_fds:
+            try:
+                self._ioctl(line_fd, GPIO_V2_LINE_SET_CONFIG_IOCTL,
+                            bytearray(_pack_config(GPIO_V2_LINE_FLAG_INPUT)))
+            finally:
+                os.close(line_fd)
+                for channel, (fd, _) in list(self._lines.items()):
+                    if fd == line_fd:
+                        del self._lines[channel]
@@ -0,0 +1,431 @@
+# -*- coding: utf-8 -*-
+"""
+GPIO edge trace recording and replay for the raspberrypinixie library.
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+Records every pin level written by the library into a compact, append-only
+binary file so that exactly what was sent to the board can be inspected
+after the fact.
+
+Example:
+        >>> import raspberrypinixie
+        >>> from raspberrypinixie_trace import TraceRecorder
+        >>> recorder = TraceRecorder(raspberrypinixie.GPIO, "nixie.trace")
+        >>> raspberrypinixie.set_backend(recorder)
+        >>> raspberrypinixie.setup()
+        >>> raspberrypinixie.nixie_set(1, 2, 3, 4, 5, 6)
+        >>> raspberrypinixie.cleanup()
+        >>> recorder.close()
+
+The trace can then be decoded back into the frames latched by the shift
+registers, or replayed against another backend.
+
+Example:
+        >>> from raspberrypinixie_trace import read_trace, decode_frames
+        >>> for frame in decode_frames(read_trace("nixie.trace")):
+        ...     print(frame)
+
+The file starts with a fixed size header followed by fixed size records of
+(timestamp_ns, pin, level), all little endian. Records are never rewritten so
+a trace can be memory mapped while it is being read. Several runs can append
+to the same trace: each TraceRecorder starts with a record for the pin
+RUN_START_PIN. Timestamps come from a monotonic clock with an arbitrary base,
+so they can only be compared within a run.
+"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+import collections
+import mmap
+import os
+import struct
+import time
+import raspberrypinixie
+
+__all__ = ["TraceRecorder", "SimulatedGPIO", "TraceRecord", "LatchedFrame",
+           "read_trace", "decode_frames", "load_durations", "replay"]
+
+TRACE_MAGIC = b"RPNT"
+TRACE_VERSION = 1
+
+# Magic, version, record size.
+_HEADER = struct.Struct(str("<4sHH"))
+# Timestamp in nanoseconds, BOARD pin number, pin level.
+_RECORD = struct.Struct(str("<QBB"))
+
+# The pin of the record written when a TraceRecorder starts recording. It is
+# not a pin of the header, and marks that the timestamps after it use a new
+# base.
+RUN_START_PIN = 0xFF
+
+# Width, in bits, of the shift registers driven by each SER pin. The LED
+# controller is a single 8 bit register while the Nixie tubes are driven by
+# three chained 8 bit registers.
+LED_REGISTER_WIDTH = 8
+NIXIE_REGISTER_WIDTH = 24
+
+try:
+    _now_ns = time.perf_counter_ns
+except AttributeError:
+    def _now_ns():
+        # type: () -> int
+        return int(time.time() * 1e9)
+
+TraceRecord = collections.namedtuple("TraceRecord",
+                                     ["timestamp_ns", "pin", "level"])
+
+LatchedFrame = collections.namedtuple("LatchedFrame",
+                                      ["timestamp_ns", "kind", "values",
+                                       "enabled"])
+
+
+class SimulatedGPIO(object):
+    """A GPIO backend which only keeps track of the pin levels.
+
+    This allows the library to be driven without a Raspberry Pi, e.g. as the
+    target of a replay or to measure timing with TraceRecorder.
+    """
+    LOW = 0
+    HIGH = 1
+    BOARD = 10
+    BCM = 11
+    OUT = 0
+
+    def __init__(self):
+        # type: () -> None
+        self.mode = None  # type: Optional[int]
+        self.levels = {}  # type: Dict[int, int]
+
+    def setmode(self, mode):
+        # type: (int) -> None
+        self.mode = mode
+
+    def setup(self, channels, direction, initial=LOW):
+        # type: (Union[int, Iterable[int]], int, int) -> None
+        for channel in raspberrypinixie._as_list(channels):
+            self.levels[channel] = int(bool(initial))
+
+    def output(self, channels, values):
+        # type: (Union[int, List[int]], Any) -> None
+        for channel, value in raspberrypinixie._pair_outputs(channels, values):
+            self.levels[channel] = int(bool(value))
+
+    def cleanup(self, channels=None):
+        # type: (Optional[Union[int, Iterable[int]]]) -> None
+        if channels is None:
+            self.levels.clear()
+        else:
+            for channel in raspberrypinixie._as_list(channels):
+                self.levels.pop(channel, None)
+
+
+class TraceRecorder(object):
+    """Wraps a GPIO backend and records every pin level written through it.
+
+    Records are packed into a write buffer and appended to the trace file, so
+    recording an edge costs one struct pack on top of the wrapped call. Any
+    attribute not handled here is forwarded to the wrapped backend.
+
+    Args:
+        backend: The GPIO backend to forward calls to.
+        path: The trace file to append records to. It is created if it does
+            not exist.
+        buffering: Size, in bytes, of the write buffer.
+    """
+
+    def __init__(self, backend, path, buffering=64 * 1024):
+        # type: (Any, str, int) -> None
+        self.backend = backend
+        self.path = path
+        self._file = open(path, "ab", buffering)
+        try:
+            if self._file.tell() == 0:
+                self._file.write(_HEADER.pack(TRACE_MAGIC, TRACE_VERSION,
+                                              _RECORD.size))
+            else:
+                _check_header(path)
+        except Exception:
+            self._file.close()
+            raise
+        self._pack = _RECORD.pack
+        self._write = self._file.write
+        self._write(self._pack(_now_ns(), RUN_START_PIN, 0))
+
+    def __getattr__(self, name):
+        # type: (str) -> Any
+        return getattr(self.backend, name)
+
+    def __repr__(self):
+        # type: () -> str
+        return "{}({!r}, {!r})".format(type(self).__name__, self.backend,
+                                       self.path)
+
+    def __enter__(self):
+        # type: () -> TraceRecorder
+        return self
+
+    def __exit__(self, *exc_info):
+        # type: (*Any) -> None
+        self.close()
+
+    def _record(self, channels, values):
+        # type: (Union[int, List[int]], Any) -> None
+        timestamp_ns = _now_ns()
+        pack = self._pack
+        for channel, value in raspberrypinixie._pair_outputs(channels, values):
+            self._write(pack(timestamp_ns, channel, bool(value)))
+
+    def setup(self, channels, direction, **kwargs):
+        # type: (Union[int, Iterable[int]], int, **Any) -> None
+        self.backend.setup(channels, direction, **kwargs)
+        if "initial" in kwargs:
+            self._record(channels, kwargs["initial"])
+
+    def output(self, channels, values):
+        # type: (Union[int, List[int]], Any) -> None
+        self.backend.output(channels, values)
+        self._record(channels, values)
+
+    def cleanup(self, *args, **kwargs):
+        # type: (*Any, **Any) -> None
+        try:
+            self.backend.cleanup(*args, **kwargs)
+        finally:
+            self.flush()
+
+    def flush(self):
+        # type: () -> None
+        """Writes any buffered records to the trace file."""
+        self._file.flush()
+
+    def close(self):
+        # type: () -> None
+        """Flushes and closes the trace file."""
+        self._file.close()
+
+
+def _check_header(path):
+    # type: (str) -> None
+    """Raises ValueError if the file is not a trace this module can read."""
+    with open(path, "rb") as trace_file:
+        header = trace_file.read(_HEADER.size)
+    if len(header) != _HEADER.size:
+        raise ValueError("{!r} is too short to be a trace.".format(path))
+    magic, version, record_size = _HEADER.unpack(header)
+    if magic != TRACE_MAGIC or version != TRACE_VERSION or \
+            record_size != _RECORD.size:
+        raise ValueError("{!r} is not a version {} trace.".format(
+            path, TRACE_VERSION))
+
+
+def read_trace(path):
+    # type: (str) -> Iterator[TraceRecord]
+    """Reads the records of a trace file.
+
+    The file is memory mapped, so only the pages being read are loaded. A
+    trailing partial record, e.g. from a recorder which is still writing, is
+    ignored.
+
+    Args:
+        path: The trace file to read.
+
+    Returns:
+        iterator of TraceRecord in the order they were recorded, including
+        the RUN_START_PIN record of each run.
+
+    Raises:
+        ValueError: If the file is not a trace.
+        OSError: If the file cannot be read.
+    """
+    _check_header(path)
+    if os.path.getsize(path) < _HEADER.size + _RECORD.size:
+        return iter(())
+    with open(path, "rb") as trace_file:
+        trace_map = mmap.mmap(trace_file.fileno(), 0, access=mmap.ACCESS_READ)
+    return _iter_records(trace_map)
+
+
+def _iter_records(trace_map):
+    # type: (mmap.mmap) -> Iterator[TraceRecord]
+    """Unpacks the records of a memory mapped trace, then closes it."""
+    try:
+        end = len(trace_map) - (len(trace_map) - _HEADER.size) % _RECORD.size
+        unpack_from = _RECORD.unpack_from
+        for offset in range(_HEADER.size, end, _RECORD.size):
+            yield TraceRecord(*unpack_from(trace_map, offset))
+    finally:
+        trace_map.close()
+
+
+def _led_values(register):
+    # type: (Sequence[bool]) -> Tuple[bool, ...]
+    """Converts the LED register content into led_set arguments."""
+    return tuple(bool(bit) for bit in register[:6])
+
+
+def _nixie_values(register):
+    # type: (Sequence[bool]) -> Tuple[Optional[int], ...]
+    """Converts the Nixie register content into nixie_set arguments.
+
+    Each Nixie tube is driven by 4 consecutive outputs, least significant bit
+    first. Values the BCD decoder does not display are returned as None.
+    """
+    values = []
+    for index in range(0, NIXIE_REGISTER_WIDTH, 4):
+        value = sum(int(bool(bit)) << position for position, bit in
+                    enumerate(register[index:index + 4]))
+        values.append(value if value <= 9 else None)
+    return tuple(values)
+
+
+def decode_frames(records):
+    # type: (Iterable[TraceRecord]) -> Iterator[LatchedFrame]
+    """Decodes trace records into the frames latched by the shift registers.
+
+    The shift registers of the board are simulated: SER is sampled on each
+    rising edge of SRCLK and the register is latched to its outputs on each
+    rising edge of RCLK. Register content from before the trace started is
+    assumed to be low.
+
+    Args:
+        records: The trace records, e.g. from read_trace.
+
+    Returns:
+        iterator of LatchedFrame. The values are in the same order as the
+        arguments of led_set or nixie_set depending on the kind, which is
+        either "led" or "nixie". enabled is False if the output enable pin
+        was high at the time of the latch.
+    """
+    rpn = raspberrypinixie
+    registers = (
+        # kind, SER, SRCLK, RCLK, nOE, width, decoder
+        ("led", rpn.LED_SER, rpn.LED_SRCLK, rpn.LED_RCLK, rpn.LED_nOE,
+         LED_REGISTER_WIDTH, _led_values),
+        ("nixie", rpn.NIXIE_SER, rpn.NIXIE_SRCLK, rpn.NIXIE_RCLK,
+         rpn.NIXIE_nOE, NIXIE_REGISTER_WIDTH, _nixie_values),
+    )
+    levels = {}  # type: Dict[int, int]
+    by_clock = {}  # type: Dict[int, Tuple[Deque[int], int]]
+    by_latch = {}  # type: Dict[int, Tuple[str, int, Deque[int], Callable]]
+    for kind, ser, srclk, rclk, noe, width, decoder in registers:
+        shift_register = collections.deque([0] * width, maxlen=width)
+        by_clock[srclk] = shift_register, ser
+        by_latch[rclk] = kind, noe, shift_register, decoder
+
+    for timestamp_ns, pin, level in records:
+        rising = level and not levels.get(pin, 0)
+        levels[pin] = level
+        if not rising:
+            continue
+        if pin in by_clock:
+            shift_register, ser = by_clock[pin]
+            # The first value loaded is shifted to become the last value in
+            # the register.
+            shift_register.appendleft(levels.get(ser, 0))
+        elif pin in by_latch:
+            kind, noe, shift_register, decoder = by_latch[pin]
+            yield LatchedFrame(timestamp_ns, kind,
+                               decoder(list(shift_register)),
+                               not levels.get(noe, 0))
+
+
+def load_durations(records):
+    # type: (Iterable[TraceRecord]) -> Dict[str, List[int]]
+    """Measures how long each shift register load took in a trace.
+
+    A load is timed from the first rising edge of SRCLK after the previous
+    latch to the rising edge of RCLK which latches it. The spread of these
+    durations is the latch jitter of the refresh path.
+
+    Args:
+        records: The trace records, e.g. from read_trace.
+
+    Returns:
+        dict of the load durations in nanoseconds, in the order of the
+        loads, keyed by "led" and "nixie".
+    """
+    rpn = raspberrypinixie
+    clocks = {rpn.LED_SRCLK: "led", rpn.NIXIE_SRCLK: "nixie"}
+    latches = {rpn.LED_RCLK: "led", rpn.NIXIE_RCLK: "nixie"}
+    durations = {"led": [], "nixie": []}  # type: Dict[str, List[int]]
+    load_start = {}  # type: Dict[str, int]
+    levels = {}  # type: Dict[int, int]
+
+    for timestamp_ns, pin, level in records:
+        if pin == RUN_START_PIN:
+            # Timestamps of different runs cannot be compared.
+            load_start.clear()
+            continue
+        rising = level and not levels.get(pin, 0)
+        levels[pin] = level
+        if not rising:
+            continue
+        if pin in clocks:
+            load_start.setdefault(clocks[pin], timestamp_ns)
+        elif pin in latches and latches[pin] in load_start:
+            kind = latches[pin]
+            durations[kind].append(timestamp_ns - load_start.pop(kind))
+    return durations
+
+
+def replay(records, backend, realtime=True):
+    # type: (Iterable[TraceRecord], Any, bool) -> None
+    """Re-drives a backend with the levels from a trace.
+
+    The backend must already be set up with the pins used in the trace. When
+    reproducing the time between records, each run in the trace starts right
+    after the previous one.
+
+    Args:
+        records: The trace records, e.g. from read_trace.
+        backend: The GPIO backend to output the levels on.
+        realtime: Reproduce the time between records. If False, the records
+            are output as fast as possible. Defaults to True.
+    """
+    start_ns = None  # type: Optional[int]
+    replay_start_ns = _now_ns()
+    for timestamp_ns, pin, level in records:
+        if pin == RUN_START_PIN:
+            # A new run has an unrelated timestamp base.
+            start_ns = None
+            replay_start_ns = _now_ns()
+            continue
+        if realtime:
+            if start_ns is None:
+                start_ns = timestamp_ns
+            delay_ns = (timestamp_ns - start_ns) - (_now_ns() -
+                                                    replay_start_ns)
+            if delay_ns > 0:
+                time.sleep(delay_ns / 1e9)
+        backend.output(pin, level)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(
+        description="Prints the LED and Nixie tube frames latched in a trace "
+        "recorded by TraceRecorder.")
+    parser.add_argument("trace", help="The trace file to decode.")
+    parser.add_argument("--edges", action="store_true",
+                        help="Print every recorded edge instead of the "
+                        "latched frames.")
+    args = parser.parse_args()
+
+    # Timestamps are printed relative to the start of their run.
+    run_start_ns = [0]
+
+    def track_runs(records):
+        # type: (Iterable[TraceRecord]) -> Iterator[TraceRecord]
+        for record in records:
+            if record.pin == RUN_START_PIN:
+                run_start_ns[0] = record.timestamp_ns
+                print("--- run started ---")
+                continue
+            yield record
+
+    trace = track_runs(read_trace(args.trace))
+    for item in (trace if args.edges else decode_frames(trace)):
+        first_ns = run_start_ns[0]
+        print("{:>14.6f} {}".format((item.timestamp_ns - first_ns) / 1e9,
+                                    " ".join("{}={!r}".format(k, v) for k, v
+                                             in zip(item._fields[1:],
+                                                    item[1:]))))
@@ -10,12 +10,18 @@ sys.path.insert(0,
                os.path.abspath(
                    os.path.join(os.path.dirname(__file__), '..')))  # NOQA
 
-from datetime import datetime, timedelta
+from datetime import timedelta
 from collections import deque
 import logging
 import time
 import argparse
 import raspberrypinixie
+from raspberrypinixie_clock import ClockEngine
+
+try:
+    from zoneinfo import ZoneInfo
+except ImportError:
+    ZoneInfo = None
 
 
 logger = logging.getLogger("raspberrypinixie")
@@ -32,14 +38,29 @@ if __name__ == "__main__":
     parser.add_argument("--verbose", "-v", action="count", default=0,
                         help="Change the logger level. Further increase "
                         "verbosity by repeating this option.")
-    parser.add_argument("--hour-offset", help="As there's no timezone support"
-                        "in native python, this option allows basic clock "
-                        "usage in your timezone", type=float, default=0.0)
-    parser.add_argument("--date", help="Display the Year Month Day"
-                        "instead of the time", action="store_const",
-                        const="%y%m%d", dest="format", default='%H%M%S')
+    parser.add_argument("--timezone", help="The IANA timezone to display, "
+                        "e.g. America/Los_Angeles. Requires python 3.9 or "
+                        "later. Defaults to the system timezone.")
+    parser.add_argument("--hour-offset", help="Hours to add to the displayed "
+                        "time. Allows basic clock usage in your timezone "
+                        "where --timezone is not supported", type=float,
+                        default=0.0)
+    parser.add_argument("--date", help="Display the Year Month Day "
+                        "instead of the time", action="store_true")
     args = parser.parse_args()
 
+    timezone = None
+    if args.timezone:
+        if ZoneInfo is None:
+            parser.error("--timezone requires python 3.9 or later. Use "
+                         "--hour-offset instead.")
+        try:
+            timezone = ZoneInfo(args.timezone)
+        except (KeyError, ValueError):
+            # ZoneInfoNotFoundError is a KeyError. Malformed keys, e.g.
+            # absolute paths, raise ValueError.
+            parser.error("Unknown timezone {!r}.".format(args.timezone))
+
     ##########################################################################
 
     # Configure the logger.
@@ -65,15 +86,17 @@ if __name__ == "__main__":
 
     ##########################################################################
 
+    # Every frame is precomputed here so that each tick is only a lookup.
+    clock = ClockEngine(tz=timezone, date=args.date,
+                        offset=timedelta(hours=args.hour_offset))
+
+    ##########################################################################
+
     print("Starting Clock program. Interrupt to exit.")
     try:
         raspberrypinixie.setup()
         while True:
-            time_str = (datetime.now() +
-                        timedelta(hours=args.hour_offset)
-                        ).strftime(args.format)
-
-            raspberrypinixie.nixie_set(*(int(i) for i in time_str))
+            clock.tick()
             raspberrypinixie.led_set(*led_states)
 
             time.sleep(1)
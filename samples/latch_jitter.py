@@ -0,0 +1,102 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+import os
+import sys
+# Configure paths so that you can run this without having to install
+# raspberrypinixie as module
+sys.path.insert(0,
+               os.path.abspath(
+                   os.path.join(os.path.dirname(__file__), '..')))  # NOQA
+
+import argparse
+import logging
+import tempfile
+import raspberrypinixie
+from raspberrypinixie_trace import (TraceRecorder, SimulatedGPIO, read_trace,
+                                    load_durations)
+
+
+logger = logging.getLogger("raspberrypinixie")
+
+
+def measure(loads, garbage):
+    # type: (int, int) -> List[int]
+    """Loads the Nixie tubes and returns how long each load took in ns."""
+    fd, path = tempfile.mkstemp(suffix=".trace")
+    os.close(fd)
+    os.remove(path)
+    try:
+        with TraceRecorder(SimulatedGPIO(), path) as recorder:
+            raspberrypinixie.set_backend(recorder)
+            raspberrypinixie.setup(clear_led=False, clear_nixie=False)
+            for load in range(loads):
+                # Reference cycles keep the garbage collector busy, like a
+                # long running application would.
+                for _ in range(garbage):
+                    cycle = []
+                    cycle.append(cycle)
+                raspberrypinixie.nixie_set(*[load % 10] * 6)
+            raspberrypinixie.cleanup(clear_led=False, clear_nixie=False)
+        return load_durations(read_trace(path))["nixie"]
+    finally:
+        os.remove(path)
+
+
+def summarize(durations):
+    # type: (List[int]) -> str
+    """Formats the spread of load durations in microseconds."""
+    durations = sorted(durations)
+    return ("min {:9.1f}  median {:9.1f}  p99 {:9.1f}  max {:9.1f}  "
+            "jitter (max - min) {:9.1f} us".format(
+                durations[0] / 1e3, durations[len(durations) // 2] / 1e3,
+                durations[int(len(durations) * 0.99)] / 1e3,
+                durations[-1] / 1e3, (durations[-1] - durations[0]) / 1e3))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Measures the latch jitter of the Nixie tube refresh "
+        "path with and without the real-time profile, using simulated GPIO "
+        "and the timestamps of a trace. Run as root for the scheduler and "
+        "memory locking parts of the profile to apply.")
+    parser.add_argument("--loads", type=int, default=500,
+                        help="How many times to load the Nixie tubes.")
+    parser.add_argument("--garbage", type=int, default=1000,
+                        help="Reference cycles to create between loads.")
+    parser.add_argument("--priority", type=int, default=50,
+                        help="SCHED_FIFO priority of the real-time profile.")
+    parser.add_argument("--cpu", type=int, action="append",
+                        help="CPU to pin to in the real-time profile. Can be "
+                        "repeated.")
+    parser.add_argument("--verbose", "-v", action="count", default=0,
+                        help="Change the logger level. Further increase "
+                        "verbosity by repeating this option.")
+    args = parser.parse_args()
+
+    ##########################################################################
+
+    # Configure the logger.
+    formatter = logging.Formatter(
+        '%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    sh = logging.StreamHandler()
+    sh.setFormatter(formatter)
+    logger.addHandler(sh)
+    # logging can only go as low as DEBUG which is specified by the user as
+    # 2 verbose flags.
+    logger.setLevel(max(
+        logging.DEBUG,
+        logger.getEffectiveLevel() - args.verbose * logging.DEBUG))
+
+    ##########################################################################
+
+    print("Default:   " + summarize(measure(args.loads, args.garbage)))
+    applied = raspberrypinixie.realtime_enable(priority=args.priority,
+                                               cpus=args.cpu)
+    try:
+        print("Real-time: " + summarize(measure(args.loads, args.garbage)))
+    finally:
+        raspberrypinixie.realtime_disable()
+    print("Real-time profile parts applied: {}".format(
+        ", ".join(sorted(k for k, v in applied.items() if v)) or "none"))
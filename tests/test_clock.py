@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+import os
+import sys
+# Configure paths so that you can run this without having to install
+# raspberrypinixie as module
+sys.path.insert(0,
+                os.path.abspath(
+                    os.path.join(os.path.dirname(__file__), '..')))  # NOQA
+
+import datetime
+import raspberrypinixie
+from raspberrypinixie_clock import ClockEngine, DATE_TABLE_DAYS
+
+
+def test_time_frame():
+    clock = ClockEngine()
+    assert clock.frame(datetime.datetime(2020, 1, 2, 13, 45, 7)) == \
+        raspberrypinixie.nixie_pack(1, 3, 4, 5, 0, 7)
+
+
+def test_date_table_built_at_startup():
+    clock = ClockEngine(date=True)
+    assert clock.table_bytes > 0
+    today = clock.now()
+    assert clock.frame(today) == raspberrypinixie.nixie_pack(
+        *(int(digit) for digit in today.strftime("%y%m%d")))
+
+
+def test_date_table_rebuilt_out_of_range():
+    clock = ClockEngine(date=True)
+    later = clock.now() + datetime.timedelta(days=DATE_TABLE_DAYS)
+    assert clock.frame(later) == raspberrypinixie.nixie_pack(
+        *(int(digit) for digit in later.strftime("%y%m%d")))
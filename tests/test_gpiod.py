@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+import os
+import sys
+# Configure paths so that you can run this without having to install
+# raspberrypinixie as module
+sys.path.insert(0,
+                os.path.abspath(
+                    os.path.join(os.path.dirname(__file__), '..')))  # NOQA
+
+import struct
+import threading
+import time
+import pytest
+import raspberrypinixie
+from raspberrypinixie_gpiod import GpiodGPIO
+
+# Values from linux/gpio.h, written out independently of the module under
+# test.
+GPIO_V2_GET_LINE_IOCTL = 0xC250B407
+GPIO_V2_LINE_SET_CONFIG_IOCTL = 0xC110B40D
+GPIO_V2_LINE_SET_VALUES_IOCTL = 0xC010B40F
+LINE_REQUEST_SIZE = 592
+LINE_CONFIG_SIZE = 272
+LINE_VALUES_SIZE = 16
+FLAG_INPUT = 1 << 2
+FLAG_OUTPUT = 1 << 3
+ATTR_ID_OUTPUT_VALUES = 2
+
+# LED_OUTPUTS_PINS + NIXIE_OUTPUT_PINS as BCM line offsets.
+EXPECTED_OFFSETS = [22, 24, 10, 23, 17, 27, 14, 18]
+
+
+class FakeKernel(object):
+    """Answers the GPIO ioctls in place of the kernel."""
+
+    def __init__(self):
+        self.calls = []
+        self.requests = {}
+        self.configs = {}
+        self.lock = threading.Lock()
+
+    def ioctl(self, fd, request, buf):
+        # Let other threads run before the buffer is read, as a system call
+        # would.
+        time.sleep(0)
+        with self.lock:
+            self.calls.append((fd, request, bytes(buf)))
+        if request == GPIO_V2_GET_LINE_IOCTL:
+            assert len(buf) == LINE_REQUEST_SIZE
+            line_fd = os.open(os.devnull, os.O_RDONLY)
+            struct.pack_into(str("<i"), buf, 588, line_fd)
+            self.requests[line_fd] = bytes(buf)
+        elif request == GPIO_V2_LINE_SET_CONFIG_IOCTL:
+            assert len(buf) == LINE_CONFIG_SIZE
+            self.configs[fd] = bytes(buf)
+        elif request == GPIO_V2_LINE_SET_VALUES_IOCTL:
+            assert len(buf) == LINE_VALUES_SIZE
+            assert fd in self.requests
+        else:
+            pytest.fail("Unexpected ioctl {:#x}".format(request))
+        return 0
+
+    def count(self, request):
+        return sum(1 for _, call, _ in self.calls if call == request)
+
+
+@pytest.fixture
+def kernel(tmpdir, monkeypatch):
+    monkeypatch.setattr(raspberrypinixie, "PULSE_WIDTH_SEC", 0)
+    kernel = FakeKernel()
+    chip = tmpdir.join("gpiochip0")
+    chip.write("")
+    kernel.backend = GpiodGPIO(str(chip), ioctl=kernel.ioctl)
+    monkeypatch.setattr(raspberrypinixie, "GPIO", kernel.backend)
+    raspberrypinixie.setup(clear_led=False, clear_nixie=False)
+    yield kernel
+    if kernel.backend._lines:
+        raspberrypinixie.cleanup(clear_led=False, clear_nixie=False)
+
+
+def test_line_request_layout(kernel):
+    assert kernel.count(GPIO_V2_GET_LINE_IOCTL) == 1
+    (line_fd, request), = kernel.requests.items()
+    offsets = struct.unpack_from(str("<64I"), request, 0)
+    consumer = request[256:288].rstrip(b"\0")
+    flags, num_attrs = struct.unpack_from(str("<QI"), request, 288)
+    attr_id, values, mask = struct.unpack_from(str("<I4xQQ"), request, 320)
+    num_lines, = struct.unpack_from(str("<I"), request, 560)
+
+    assert num_lines == 8
+    assert list(offsets[:8]) == EXPECTED_OFFSETS
+    assert not any(offsets[8:])
+    assert consumer == b"raspberrypinixie"
+    assert flags == FLAG_OUTPUT
+    assert (num_attrs, attr_id, values, mask) == \
+        (1, ATTR_ID_OUTPUT_VALUES, 0, 0xFF)
+
+
+def test_output_writes_channels_together(kernel):
+    del kernel.calls[:]
+    kernel.backend.output([raspberrypinixie.NIXIE_SRCLK,
+                           raspberrypinixie.NIXIE_SER], [0, 1])
+    (_, request, buf), = kernel.calls
+    assert request == GPIO_V2_LINE_SET_VALUES_IOCTL
+    # SER is line 4 and SRCLK line 7 of the request.
+    assert struct.unpack(str("<QQ"), buf) == (1 << 4, 1 << 4 | 1 << 7)
+
+
+def test_ioctls_per_load(kernel):
+    del kernel.calls[:]
+    raspberrypinixie.nixie_set(1, 2, 3, 4, 5, 6)
+    # Per bit, SER with the end of the previous clock pulse then the clock
+    # rising edge. Then the end of the last pulse and the latch pulse.
+    assert kernel.count(GPIO_V2_LINE_SET_VALUES_IOCTL) == 24 * 2 + 1 + 2
+
+    del kernel.calls[:]
+    raspberrypinixie.led_set(True)
+    assert kernel.count(GPIO_V2_LINE_SET_VALUES_IOCTL) == 6 * 2 + 1 + 2
+
+
+def test_concurrent_outputs_keep_their_values(kernel):
+    pins = {raspberrypinixie.LED_nOE: 1 << 1,
+            raspberrypinixie.NIXIE_SRCLK: 1 << 7}
+
+    def toggle(pin):
+        for _ in range(500):
+            kernel.backend.output(pin, 1)
+
+    del kernel.calls[:]
+    threads = [threading.Thread(target=toggle, args=(pin,)) for pin in pins]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    masks = [struct.unpack(str("<QQ"), buf) for _, _, buf in kernel.calls]
+    for bit in pins.values():
+        assert masks.count((bit, bit)) == 500
+
+
+def test_cleanup_reconfigures_input_and_closes(kernel):
+    (line_fd, _), = kernel.requests.items()
+    raspberrypinixie.cleanup(clear_led=False, clear_nixie=False)
+
+    config = kernel.configs[line_fd]
+    assert struct.unpack_from(str("<QI"), config, 0) == (FLAG_INPUT, 0)
+    with pytest.raises(OSError):
+        os.fstat(line_fd)
+    assert not kernel.backend._lines
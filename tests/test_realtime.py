@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+import os
+import sys
+# Configure paths so that you can run this without having to install
+# raspberrypinixie as module
+sys.path.insert(0,
+                os.path.abspath(
+                    os.path.join(os.path.dirname(__file__), '..')))  # NOQA
+
+import gc
+import raspberrypinixie
+from raspberrypinixie_trace import SimulatedGPIO
+
+
+def test_disable_reverts_gc_guard_when_restore_fails(monkeypatch):
+    def fail(*args):
+        raise OSError(1, "Operation not permitted")
+
+    applied = raspberrypinixie.realtime_enable(priority=None,
+                                               lock_memory=False)
+    assert applied["gc_guard"]
+    monkeypatch.setitem(raspberrypinixie._realtime_restore, "scheduler",
+                        (0, None))
+    monkeypatch.setattr(raspberrypinixie.os, "sched_setscheduler", fail,
+                        raising=False)
+
+    raspberrypinixie.realtime_disable()
+
+    assert not raspberrypinixie._gc_guard
+    assert "scheduler" not in raspberrypinixie._realtime_restore
+
+
+def test_enable_falls_back_without_privileges(monkeypatch):
+    def deny(*args):
+        raise PermissionError(1, "Operation not permitted")
+
+    monkeypatch.setattr(raspberrypinixie.os, "sched_setscheduler", deny,
+                        raising=False)
+    monkeypatch.setattr(raspberrypinixie.os, "sched_setaffinity", deny,
+                        raising=False)
+    monkeypatch.setattr(raspberrypinixie, "_libc_call", deny)
+
+    try:
+        applied = raspberrypinixie.realtime_enable(priority=50, cpus=[0])
+    finally:
+        raspberrypinixie.realtime_disable()
+
+    assert not applied["scheduler"]
+    assert not applied["affinity"]
+    assert not applied["lock_memory"]
+    assert applied["gc_guard"]
+
+
+def test_gc_disabled_during_loads(monkeypatch):
+    class GCRecordingGPIO(SimulatedGPIO):
+        def __init__(self):
+            super(GCRecordingGPIO, self).__init__()
+            self.gc_enabled = []
+
+        def output(self, channels, values):
+            self.gc_enabled.append(gc.isenabled())
+            super(GCRecordingGPIO, self).output(channels, values)
+
+    backend = GCRecordingGPIO()
+    monkeypatch.setattr(raspberrypinixie, "PULSE_WIDTH_SEC", 0)
+    monkeypatch.setattr(raspberrypinixie, "GPIO", backend)
+    assert gc.isenabled()
+
+    raspberrypinixie.realtime_enable(priority=None, lock_memory=False)
+    try:
+        raspberrypinixie.nixie_set(1, 2, 3, 4, 5, 6)
+        assert gc.isenabled()
+    finally:
+        raspberrypinixie.realtime_disable()
+
+    assert backend.gc_enabled
+    assert not any(backend.gc_enabled)
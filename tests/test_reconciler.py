@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+import os
+import sys
+# Configure paths so that you can run this without having to install
+# raspberrypinixie as module
+sys.path.insert(0,
+                os.path.abspath(
+                    os.path.join(os.path.dirname(__file__), '..')))  # NOQA
+
+import time
+import pytest
+import raspberrypinixie
+from raspberrypinixie_trace import SimulatedGPIO
+
+
+@pytest.fixture
+def simulated_board(monkeypatch):
+    monkeypatch.setattr(raspberrypinixie, "PULSE_WIDTH_SEC", 0)
+    monkeypatch.setattr(raspberrypinixie, "GPIO", SimulatedGPIO())
+    raspberrypinixie.setup()
+    yield
+    raspberrypinixie.cleanup()
+
+
+@pytest.mark.parametrize("kwargs", [
+    {"interval": 0}, {"interval": -1}, {"idle": 0}, {"budget": 0},
+    {"budget": 1.5},
+])
+def test_rejects_invalid_arguments(kwargs):
+    with pytest.raises(ValueError):
+        raspberrypinixie.Reconciler(**kwargs)
+
+
+def test_reconciles_when_idle(simulated_board):
+    raspberrypinixie.nixie_set(1, 2, 3)
+    reconciler = raspberrypinixie.Reconciler(interval=0.01, idle=0.01)
+    time.sleep(0.02)
+    assert reconciler.reconcile()
+    assert reconciler.runs == 1
+
+
+def test_busy_display_is_not_polled_continuously(simulated_board):
+    reconciler = raspberrypinixie.Reconciler(interval=0.01, idle=0.01,
+                                             budget=1)
+    reconciler.start()
+    try:
+        end = time.time() + 0.5
+        while time.time() < end:
+            raspberrypinixie.led_set(True)
+    finally:
+        reconciler.stop()
+    attempts = reconciler.runs + reconciler.aborted + reconciler.deferred
+    assert attempts <= 0.5 / raspberrypinixie.RECONCILE_MIN_RETRY_SEC + 2
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+import os
+import sys
+# Configure paths so that you can run this without having to install
+# raspberrypinixie as module
+sys.path.insert(0,
+                os.path.abspath(
+                    os.path.join(os.path.dirname(__file__), '..')))  # NOQA
+
+import gc
+import itertools
+import warnings
+import pytest
+import raspberrypinixie
+import raspberrypinixie_trace
+from raspberrypinixie_trace import (TraceRecorder, SimulatedGPIO, read_trace,
+                                    decode_frames, replay, RUN_START_PIN)
+
+
+# The frames latched by record_session, as (kind, values, enabled).
+EXPECTED_FRAMES = [
+    ("led", (False,) * 6, True),
+    ("nixie", (None,) * 6, True),
+    ("nixie", (1, 2, None, 4, 5, 9), True),
+    ("led", (True, False, True, False, False, True), True),
+    ("nixie", (0, 9, 8, None, 7, 6), True),
+    ("led", (False,) * 6, False),
+    ("nixie", (None,) * 6, False),
+]
+
+
+@pytest.fixture(autouse=True)
+def no_pulse_delay(monkeypatch):
+    monkeypatch.setattr(raspberrypinixie, "PULSE_WIDTH_SEC", 0)
+
+
+def record_session(path, monkeypatch):
+    """Records a session driving every way of setting the registers."""
+    with TraceRecorder(SimulatedGPIO(), path) as recorder:
+        monkeypatch.setattr(raspberrypinixie, "GPIO", recorder)
+        raspberrypinixie.setup()
+        try:
+            raspberrypinixie.nixie_set(1, 2, None, 4, 5, 9)
+            raspberrypinixie.led_set(True, False, True, False, False, True)
+            raspberrypinixie.nixie_set_packed(
+                raspberrypinixie.nixie_pack(0, 9, 8, None, 7, 6))
+        finally:
+            raspberrypinixie.cleanup()
+
+
+def frames(records):
+    return [(frame.kind, frame.values, frame.enabled)
+            for frame in decode_frames(records)]
+
+
+def test_decode_frames(tmpdir, monkeypatch):
+    path = str(tmpdir.join("session.trace"))
+    record_session(path, monkeypatch)
+    assert frames(read_trace(path)) == EXPECTED_FRAMES
+
+
+def test_replay_round_trip(tmpdir, monkeypatch):
+    path = str(tmpdir.join("session.trace"))
+    replayed_path = str(tmpdir.join("replayed.trace"))
+    record_session(path, monkeypatch)
+
+    backend = SimulatedGPIO()
+    backend.setup(raspberrypinixie.LED_OUTPUTS_PINS +
+                  raspberrypinixie.NIXIE_OUTPUT_PINS, backend.OUT)
+    with TraceRecorder(backend, replayed_path) as recorder:
+        replay(read_trace(path), recorder, realtime=False)
+
+    assert frames(read_trace(replayed_path)) == EXPECTED_FRAMES
+
+
+def test_appended_runs(tmpdir, monkeypatch):
+    path = str(tmpdir.join("session.trace"))
+    # The second run starts long after the first one.
+    clocks = [itertools.count(0), itertools.count(10 ** 12)]
+    monkeypatch.setattr(raspberrypinixie_trace, "_now_ns",
+                        lambda: next(clocks[0]))
+    record_session(path, monkeypatch)
+    clocks.pop(0)
+    record_session(path, monkeypatch)
+
+    records = list(read_trace(path))
+    assert [record.pin for record in records].count(RUN_START_PIN) == 2
+    assert frames(records) == EXPECTED_FRAMES * 2
+
+    # Each run is replayed right after the previous one, without sleeping
+    # through the difference between their clocks.
+    sleeps = []
+    monkeypatch.setattr(raspberrypinixie_trace.time, "sleep", sleeps.append)
+    replay_clock = itertools.count(0)
+    monkeypatch.setattr(raspberrypinixie_trace, "_now_ns",
+                        lambda: next(replay_clock))
+    replay(records, SimulatedGPIO(), realtime=True)
+    assert sum(sleeps) < 1
+
+
+def test_read_trace_checks_header_on_call(tmpdir):
+    path = tmpdir.join("not.trace")
+    path.write("not a trace")
+    with pytest.raises(ValueError):
+        read_trace(str(path))
+    with pytest.raises(OSError):
+        read_trace(str(tmpdir.join("missing.trace")))
+
+
+def test_recorder_closes_file_on_bad_header(tmpdir):
+    path = tmpdir.join("not.trace")
+    path.write("not a trace")
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always", ResourceWarning)
+        with pytest.raises(ValueError):
+            TraceRecorder(SimulatedGPIO(), str(path))
+        gc.collect()
+    assert not [warning for warning in caught
+                if issubclass(warning.category, ResourceWarning)]